@@ -0,0 +1,5 @@
+"""
+Benchmark harness for download.py (mock WIM API, synthetic CSVs, scripted scenarios).
+
+Run scenarios with `python -m bench.run`, see `python -m bench.run --help`.
+"""
@@ -0,0 +1,273 @@
+import argparse
+import io
+import json
+import multiprocessing
+import random
+import secrets
+import threading
+import time
+
+from dataclasses import dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from hashlib import md5
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from .synthetic import TAGS, class_list, make_vehicle, vehicle_ids_between, write_csv
+
+
+CHUNK_SIZE = 16_384
+
+
+@dataclass(frozen=True)
+class MockConfig:
+    latency: float = 0.0  # seconds added to every response
+    jitter: float = 0.0  # latency is uniformly spread by +- jitter
+    error_rate: float = 0.0  # probability of a 500 response
+    bandwidth: float = 0.0  # bytes per second per response, 0 = unlimited
+    image_size: int = 100_000  # bytes
+    seed: Optional[int] = None
+    vehicles: int = 100_000  # vehicles with ids 1..vehicles exist (for vehicle/list)
+    require_auth: bool = False  # 401 without a valid token from auth/login
+    username: str = "bench"
+    password: str = "bench"
+    token_ttl: float = 3600.0  # seconds
+
+
+def fake_jpeg(size: int, header: bytes = b"") -> bytes:
+    """JPEG-looking bytes (SOI header ... EOI markers) of exactly `size` bytes"""
+    size = max(size, len(header) + 4)
+    filler = bytes(range(256)) * (size // 256 + 1)
+    return b"\xff\xd8" + header + filler[:size - 4 - len(header)] + b"\xff\xd9"
+
+
+class MockWimHandler(BaseHTTPRequestHandler):
+    # keep-alive, the same as the real device
+    protocol_version = "HTTP/1.1"
+    server: "MockWimServer"
+
+    def log_message(self, format, *args) -> None:
+        # the default implementation writes every request to stderr
+        pass
+
+    def do_HEAD(self) -> None:
+        self.do_GET()
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.wait_latency()
+        if self._api_path() != "/api/auth/login":
+            self._send(404, b"Not found", "text/plain")
+            return
+        try:
+            credentials = json.loads(body)
+            username, password = credentials["username"], credentials["password"]
+        except (ValueError, KeyError, TypeError):
+            self._send(400, b"Bad credentials format", "text/plain")
+            return
+        if (username, password) != (self.server.config.username, self.server.config.password):
+            self._send(401, b"Wrong username or password", "text/plain")
+            return
+        token = self.server.new_token()
+        self._send(200, json.dumps({"data": {"token": token}}).encode(), "application/json")
+
+    def do_GET(self) -> None:
+        query = parse_qs(urlsplit(self.path).query)
+        path = self._api_path()
+        self.server.wait_latency()
+        if self.server.config.require_auth and not self._authorized():
+            self._send(401, b"Unauthorized", "text/plain")
+        elif self.server.should_fail():
+            self._send(500, b"Mock error", "text/plain")
+        elif path == "/api/vehicle/list":
+            self._vehicle_list(query)
+        elif path == "/api/vehicle/detail":
+            self._vehicle_detail(query)
+        elif path == "/api/image":
+            self._image(query)
+        elif path == "/api/class/list":
+            self._class_list()
+        else:
+            self._send(404, b"Not found", "text/plain")
+
+    def _api_path(self) -> str:
+        path = urlsplit(self.path).path
+        if path.startswith("/api/1.0/"):
+            path = "/api/" + path[len("/api/1.0/"):]
+        return path
+
+    def _authorized(self) -> bool:
+        auth = self.headers.get("Authorization", "")
+        return auth.startswith("Bearer ") and self.server.token_valid(auth[len("Bearer "):])
+
+    def _vehicle_list(self, query) -> None:
+        try:
+            start = datetime.fromisoformat(query["from"][0])
+            end = datetime.fromisoformat(query["to"][0])
+            page = int(query.get("page", ["0"])[0])
+            page_size = int(query.get("pageSize", ["1000"])[0])
+        except (KeyError, ValueError):
+            self._send(400, b"Missing or invalid from/to/page/pageSize", "text/plain")
+            return
+        ids = vehicle_ids_between(start, end)
+        ids = range(ids.start, min(ids.stop, self.server.config.vehicles + 1))
+        text = io.StringIO()
+        write_csv(text, ids[page * page_size:(page + 1) * page_size])
+        self._send(200, text.getvalue().encode(), "text/csv")
+
+    def _vehicle_detail(self, query) -> None:
+        try:
+            vehicle_id = int(query["id"][0])
+        except (KeyError, ValueError):
+            self._send(400, b"Missing id", "text/plain")
+            return
+        vehicle = make_vehicle(vehicle_id)
+        vehicle["images"] = [
+            {"tag": tag, "url": f"/api/1.0/image?id={vehicle_id}&tag={tag}"}
+            for tag in TAGS
+        ]
+        self._send(200, json.dumps({"data": vehicle}).encode(), "application/json")
+
+    def _class_list(self) -> None:
+        if self.headers.get("If-None-Match") == self.server.class_list_etag:
+            self.send_response(304)
+            self.send_header("ETag", self.server.class_list_etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, self.server.class_list, "application/json",
+                   {"ETag": self.server.class_list_etag})
+
+    def _image(self, query) -> None:
+        tag = query.get("tag", [""])[0]
+        if "id" not in query or tag not in TAGS:
+            self._send(404, b"Unknown image", "text/plain")
+            return
+        # every image is different (for deduplication)
+        image = fake_jpeg(self.server.config.image_size, f"{query['id'][0]}:{tag}".encode())
+        self._send(200, image, "image/jpeg")
+
+    def _send(self, status: int, body: bytes, content_type: str,
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        bandwidth = self.server.config.bandwidth
+        if bandwidth <= 0:
+            self.wfile.write(body)
+            return
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / bandwidth)
+
+
+class MockWimServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig) -> None:
+        super().__init__(address, MockWimHandler)
+        self.config = config
+        self.class_list = json.dumps({"data": class_list()}).encode()
+        self.class_list_etag = f'"{md5(self.class_list).hexdigest()}"'
+        self._random = random.Random(config.seed)
+        # token -> expiry (time.monotonic)
+        self._tokens: Dict[str, float] = {}
+        self._tokens_lock = threading.Lock()
+
+    def new_token(self) -> str:
+        token = secrets.token_hex(16)
+        with self._tokens_lock:
+            self._tokens[token] = time.monotonic() + self.config.token_ttl
+        return token
+
+    def token_valid(self, token: str) -> bool:
+        with self._tokens_lock:
+            return self._tokens.get(token, 0.0) > time.monotonic()
+
+    def wait_latency(self) -> None:
+        delay = self.config.latency + \
+            self._random.uniform(-self.config.jitter, self.config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self) -> bool:
+        return self._random.random() < self.config.error_rate
+
+
+def _serve(config: MockConfig, host: str, port: int, port_queue) -> None:
+    with MockWimServer((host, port), config) as server:
+        port_queue.put(server.server_address[1])
+        server.serve_forever()
+
+
+class MockServerProcess:
+    """
+    Runs the mock server in its own process (so it does not eat the measured process' CPU).
+    Use as a context manager, the url is available as `.url` inside it.
+    """
+
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config
+        self.host = host
+        self.port = port
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self) -> "MockServerProcess":
+        port_queue: multiprocessing.Queue = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self.config, self.host, self.port, port_queue), daemon=True)
+        self._process.start()
+        self.port = port_queue.get(timeout=10)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Local stand-in for the WIM API (auth/login, vehicle/list, vehicle/detail, class/list and images)"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="Port to bind")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="SECONDS",
+                        help="Latency added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, metavar="SECONDS",
+                        help="Latency is spread uniformly by +- jitter")
+    parser.add_argument("--error_rate", type=float, default=0.0, metavar="P",
+                        help="Probability of responding with 500")
+    parser.add_argument("--bandwidth", type=float, default=0.0, metavar="BYTES/S",
+                        help="Bandwidth per response, 0 for unlimited")
+    parser.add_argument("--image_size", type=int, default=100_000, metavar="BYTES",
+                        help="Size of served images")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and errors")
+    parser.add_argument("--vehicles", type=int, default=100_000, metavar="N",
+                        help="Number of vehicles listed by vehicle/list")
+    parser.add_argument("--require_auth", action="store_true",
+                        help="Respond with 401 without a token from auth/login")
+    parser.add_argument("--username", default="bench", help="Username accepted by auth/login")
+    parser.add_argument("--password", default="bench", help="Password accepted by auth/login")
+    parser.add_argument("--token_ttl", type=float, default=3600.0, metavar="SECONDS",
+                        help="Lifetime of tokens from auth/login")
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.jitter, args.error_rate,
+                        args.bandwidth, args.image_size, args.seed, args.vehicles,
+                        args.require_auth, args.username, args.password, args.token_ttl)
+    with MockWimServer((args.host, args.port), config) as server:
+        print(f"Serving mock WIM API on http://{args.host}:{server.server_address[1]}")
+        server.serve_forever()
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import statistics
+import tempfile
+import time
+
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from datadwn import net_worker
+from datadwn.logger import get_logger
+from datadwn.logic import Downloader, DownloaderArgs
+from datadwn.net_worker import NetLevels
+
+from .mock_server import MockConfig, MockServerProcess
+from .synthetic import START_TIME, generate_csv
+
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+
+logger = get_logger()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _auto_confirm(prompt: str) -> str:
+    # levels 0 and 1 ask a human, the benchmark answers yes to everything
+    return "y"
+
+
+def _instrument_client(downloader: Downloader, latencies: List[float]) -> None:
+    """Record the duration of every request sent by the downloader, including the body"""
+    worker = downloader.net_worker
+    client = worker.client
+    send = client.send
+    budgeted_get = worker._budgeted_get
+
+    async def timed_send(*args, **kwargs):
+        if kwargs.get("stream"):
+            # returns with the headers only, streamed requests are timed by timed_budgeted_get
+            return await send(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await send(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    async def timed_budgeted_get(*args, **kwargs):
+        # level 1 streams the body (to count it against the limit)
+        start = time.perf_counter()
+        try:
+            return await budgeted_get(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    client.send = timed_send  # type: ignore[assignment]
+    worker._budgeted_get = timed_budgeted_get  # type: ignore[assignment]
+
+
+async def _run_downloader(args: DownloaderArgs, latencies: List[float]) -> Downloader:
+    downloader = Downloader(args)
+    _instrument_client(downloader, latencies)
+    await downloader.get_images()
+    return downloader
+
+
+def run_scenario(level: int, event_loop: str, server_url: str, input_file: str, save_dir: str,
+                 bench_args: argparse.Namespace) -> Dict[str, Any]:
+    """Run one download with the given net level, meant to be ran in a fresh process"""
+    logger.setLevel(bench_args.log_level)
+    if event_loop == "uvloop":
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    net_worker.ainput = _auto_confirm  # type: ignore[assignment]
+    args = DownloaderArgs(
+        loc_code="bn",
+        base_url=server_url,
+        save_dir=save_dir,
+        download_delay=bench_args.download_delay,
+        file_extension="jpg",
+        verify_ssl=False,
+        input_file=input_file,
+        net_level=level,
+        data_limit=bench_args.data_limit * 1_048_576,
+        link_has_number=True,
+        plan=False,
+        dry_run=False,
+        plan_sample=0,
+        class_cache=os.path.join(save_dir, "class_cache"),
+        tags=bench_args.tags,
+        catalog=bench_args.catalog,
+        catalog_batch=1000,
+        # the bench measures on its own
+        profile=False,
+        profile_sampling=False,
+        profile_output="",
+        uvloop=event_loop == "uvloop",
+        # listing covers exactly the generated vehicles (one every 1.5 s)
+        time_from=START_TIME if bench_args.listing else None,
+        time_to=START_TIME + timedelta(milliseconds=1500 * (bench_args.vehicles + 1)),
+        windows=bench_args.windows,
+        page_size=bench_args.page_size,
+        username="bench" if bench_args.listing else None,
+        password="bench",
+    )
+    latencies: List[float] = []
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    downloader = asyncio.run(_run_downloader(args, latencies))
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {
+        "level": NetLevels.ALL_LEVELS[level].name,
+        "event_loop": event_loop,
+        "vehicles": bench_args.vehicles,
+        "parsed_vehicles": downloader.parsed_vehicles,
+        "saved_images": downloader.saved_images,
+        "wall_s": wall,
+        "vehicles_per_s": downloader.parsed_vehicles / wall if wall > 0 else 0.0,
+        "images_per_s": downloader.saved_images / wall if wall > 0 else 0.0,
+        "requests": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.mean(latencies) if latencies else float("nan")) * 1000,
+        "cpu_s": cpu,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _scenario_process(results, *args) -> None:
+    results.put(run_scenario(*args))
+
+
+def run_isolated(*args) -> Dict[str, Any]:
+    """
+    Run a scenario in its own process, so that peak RSS and CPU are per scenario.
+    Raises RuntimeError if the scenario process dies without a result
+    """
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_scenario_process, args=(results, *args))
+    process.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+            # the result could have been put right before the process exited
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                raise RuntimeError(
+                    f"Scenario process failed (exit code {process.exitcode}), see its traceback above")
+    finally:
+        process.join()
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    columns = ("level", "event_loop", "saved_images", "wall_s", "vehicles_per_s", "images_per_s", "requests",
+               "p50_ms", "p99_ms", "cpu_s", "peak_rss_mb")
+    lines = [" | ".join(f"{col:>18}" for col in columns)]
+    for result in results:
+        cells = []
+        for col in columns:
+            value = result[col]
+            cells.append(f"{value:>18.2f}" if isinstance(value, float) else f"{str(value):>18}")
+        lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Benchmark download.py against a local mock WIM API"
+    )
+    parser.add_argument("-n", "--vehicles", type=int, default=200,
+                        metavar="N", help="Number of vehicles in the generated CSV")
+    parser.add_argument("--levels", type=int, nargs="+", metavar="LEVEL",
+                        choices=[level.number for level in NetLevels.ALL_LEVELS],
+                        default=[level.number for level in NetLevels.ALL_LEVELS],
+                        help="Net levels to benchmark (0 and 1 are confirmed automatically)")
+    parser.add_argument("--latency", type=float, default=0.01, metavar="SECONDS",
+                        help="Mock server latency")
+    parser.add_argument("--jitter", type=float, default=0.005, metavar="SECONDS",
+                        help="Mock server latency jitter")
+    parser.add_argument("--error_rate", type=float, default=0.0, metavar="P",
+                        help="Mock server error probability")
+    parser.add_argument("--bandwidth", type=float, default=0.0, metavar="BYTES/S",
+                        help="Mock server bandwidth per response, 0 for unlimited")
+    parser.add_argument("--image_size", type=int, default=100_000, metavar="BYTES",
+                        help="Size of served images")
+    parser.add_argument("--seed", type=int, default=0, help="Mock server seed")
+    parser.add_argument("-t", "--download_delay", type=float, default=0.0, metavar="DELAY",
+                        help="download_delay passed to the downloader")
+    parser.add_argument("--data_limit", type=float, default=1_000_000, metavar="LIMIT",
+                        help="Data limit (in mb) for net level 1")
+    parser.add_argument("--tags", nargs="+", default=None, metavar="TAG",
+                        help="Image tags to download per vehicle (default: one preferred view)")
+    parser.add_argument("--catalog", action="store_true",
+                        help="Write the parquet catalog during the benchmark")
+    parser.add_argument("--listing", action="store_true",
+                        help="List vehicles from the mock API (with authentication) instead of the CSV")
+    parser.add_argument("--windows", type=int, default=4, metavar="N",
+                        help="Parallel sub-windows of the listing")
+    parser.add_argument("--page_size", type=int, default=100, metavar="N",
+                        help="Vehicles per page of the listing")
+    parser.add_argument("--event_loops", nargs="+", default=["asyncio"], choices=["asyncio", "uvloop"],
+                        help="Event loops to run every level with (uvloop has to be installed)")
+    parser.add_argument("--log_level", default="WARNING",
+                        help="Log level of the downloader during the benchmark")
+    parser.add_argument("-o", "--output", default=None, metavar="PATH",
+                        help="Write results as json (for comparing runs)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_arguments()
+    config = MockConfig(args.latency, args.jitter, args.error_rate,
+                        args.bandwidth, args.image_size, args.seed,
+                        vehicles=args.vehicles, require_auth=args.listing)
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="datadwn_bench_") as tmp_dir, \
+            MockServerProcess(config) as server:
+        input_file = os.path.join(tmp_dir, "vehicles.csv")
+        generate_csv(input_file, args.vehicles)
+        for level in args.levels:
+            for event_loop in args.event_loops:
+                save_dir = os.path.join(tmp_dir, f"images_{level}_{event_loop}")
+                print(f"Running level {level} ({event_loop}) ...", flush=True)
+                results.append(run_isolated(
+                    level, event_loop, server.url, input_file, save_dir, args))
+    print(format_results(results))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump({"config": vars(args), "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import csv
+import random
+
+from datetime import datetime, timedelta
+from json import loads
+from typing import IO, Iterable, List
+
+from datadwn.util import base_off_cwd, json_obj
+
+
+# class/list of the mock device, covering every vehicle type
+CLASSES = {
+    1: "Car", 3: "Car + trailer", 4: "Car + caravan", 2: "Van", 31: "Van + trailer",
+    27: "Bus", 36: "Articulated bus", 30: "Motorbike", 5: "Light truck",
+    6: "Truck 2 axles", 9: "Truck + trailer", 61: "Tractor + semitrailer", 403: "Truck 4 axles",
+}
+# + one ucid the device does not know
+UCIDS = tuple(CLASSES) + (999,)
+LANES = ("1", "2", "3")
+LANE_DESCRIPTION = "Mock device, MCK"
+TAGS = ("SNAP", "SNAPB")
+FLAG_COUNT = 10
+START_TIME = datetime(2022, 5, 4, 10, 0, 0)
+
+
+def csv_head() -> List[str]:
+    """CSV columns as described by datadwn/csv_info.json (flags.X expanded)"""
+    with open(base_off_cwd("../datadwn/csv_info.json", __file__), "r") as file:
+        head: List[str] = loads(file.read())["head"]
+    expanded: List[str] = []
+    for col in head:
+        if col == "flags.X":
+            expanded.extend(f"flags.{i}" for i in range(1, FLAG_COUNT + 1))
+        else:
+            expanded.append(col)
+    return expanded
+
+
+def make_vehicle(vehicle_id: int) -> json_obj:
+    """
+    Deterministic vehicle for an id, shared by the CSV generator and the mock server,
+    so that the CSV row and the vehicle/detail JSON describe the same vehicle.
+    """
+    rnd = random.Random(vehicle_id)
+    timestamp = START_TIME + timedelta(milliseconds=vehicle_id * 1500)
+    return {
+        "vehicleId": vehicle_id,
+        "frontLpCountry": "CZ",
+        "frontLpNumber": f"{rnd.randrange(1, 10)}A{rnd.randrange(10_000):04d}",
+        "rearLpCountry": "CZ",
+        "rearLpNumber": f"{rnd.randrange(1, 10)}A{rnd.randrange(10_000):04d}",
+        "timestamp": timestamp.isoformat(timespec="milliseconds") + "+02:00",
+        "lane": rnd.choice(LANES),
+        "laneDescription": LANE_DESCRIPTION,
+        "gvw": rnd.randrange(800, 32_000),  # parser reads gvw as int16
+        "length": rnd.randrange(300, 2_000),
+        "ucid": rnd.choice(UCIDS),
+        "flags": [f"F{i}" for i in range(1, FLAG_COUNT + 1) if rnd.random() < 0.05],
+    }
+
+
+def class_list() -> List[json_obj]:
+    return [{"ucid": ucid, "name": name} for ucid, name in CLASSES.items()]
+
+
+def vehicle_ids_between(start: datetime, end: datetime) -> range:
+    """Ids of vehicles with timestamp in [start, end) (time zones are ignored)"""
+    def first_id_from(time: datetime) -> int:
+        ms = (time.replace(tzinfo=None) - START_TIME) // timedelta(milliseconds=1)
+        return max(-(-ms // 1500), 1)
+    return range(first_id_from(start), first_id_from(end))
+
+
+def write_csv(file: IO[str], vehicle_ids: Iterable[int]) -> None:
+    """Write vehicles as CSV matching csv_info.json (semicolon separated)"""
+    head = csv_head()
+    writer = csv.writer(file, delimiter=";")
+    writer.writerow(head)
+    for vehicle_id in vehicle_ids:
+        vehicle = make_vehicle(vehicle_id)
+        flags = vehicle["flags"]
+        row = []
+        for col in head:
+            if col.startswith("flags."):
+                index = int(col.split(".", 1)[1]) - 1
+                row.append(flags[index] if index < len(flags) else "")
+            else:
+                row.append(vehicle[col])
+        writer.writerow(row)
+
+
+def generate_csv(path: str, rows: int, start_id: int = 1) -> None:
+    """Write a CSV with `rows` vehicles"""
+    with open(path, "w", newline="") as file:
+        write_csv(file, range(start_id, start_id + rows))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Generate a synthetic vehicles CSV (same vehicles as served by bench.mock_server)"
+    )
+    parser.add_argument("-o", "--output", default="vehicles.csv",
+                        metavar="PATH", help="Path of the generated csv")
+    parser.add_argument("-n", "--rows", type=int, default=1000,
+                        metavar="N", help="Number of vehicles")
+    parser.add_argument("--start_id", type=int, default=1,
+                        metavar="ID", help="First vehicleId")
+    args = parser.parse_args()
+    generate_csv(args.output, args.rows, args.start_id)
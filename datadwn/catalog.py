@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+
+from typing import Any, Dict, List
+from uuid import uuid4
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .logger import get_logger
+from .profiler import get_profiler
+
+
+logger = get_logger()
+profiler = get_profiler()
+
+
+CATALOG_SCHEMA = pa.schema([
+    ("vehicleId", pa.int64()),
+    ("ucid", pa.int32()),
+    ("type", pa.string()),
+    ("lane", pa.string()),
+    ("timestamp", pa.string()),
+    ("gvw", pa.int32()),
+    ("length", pa.int32()),
+    ("flags", pa.list_(pa.string())),
+    ("tag", pa.string()),
+    ("path", pa.string()),  # relative to save_dir
+    ("size", pa.int64()),
+    ("md5", pa.string()),
+])
+
+
+class Catalog:
+    """
+    Append-only parquet catalog of saved images (one row per image).
+
+    Every batch of batch_size rows is written as its own complete part file
+    (renamed into place once written), so a crashed run loses only the batch in memory.
+    Read all runs at once with `pandas.read_parquet(catalog_dir)`.
+    """
+
+    def __init__(self, catalog_dir: str, batch_size: int) -> None:
+        self.catalog_dir = catalog_dir
+        self.batch_size = batch_size
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid4().hex[:8]}"
+        self.rows: List[Dict[str, Any]] = []
+        self.written_rows = 0
+        self.written_parts = 0
+        # part files are written one at a time, in order
+        self._write_lock = asyncio.Lock()
+
+    async def add(self, row: Dict[str, Any]) -> None:
+        self.append(row)
+        if len(self.rows) >= self.batch_size:
+            await self.flush()
+
+    def append(self, row: Dict[str, Any]) -> None:
+        """Buffer a row, flushing is up to the caller"""
+        self.rows.append(row)
+
+    async def flush(self) -> None:
+        """Write buffered rows as a part file (in a thread)"""
+        if len(self.rows) == 0:
+            return
+        rows, self.rows = self.rows, []
+        async with self._write_lock:
+            with profiler.stage("catalog_write", cpu=False):
+                await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self.written_parts > 0:
+            logger.info(f"Catalog: {self.written_rows} images in {self.written_parts} " +
+                        f"part files part-{self.run_id}-*.parquet in {self.catalog_dir}")
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        table = pa.Table.from_pylist(rows, schema=CATALOG_SCHEMA)
+        os.makedirs(self.catalog_dir, exist_ok=True)
+        name = f"part-{self.run_id}-{self.written_parts:05d}.parquet"
+        # readers skip files starting with a dot, an interrupted write is never read
+        tmp_path = os.path.join(self.catalog_dir, f".{name}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.catalog_dir, name))
+        self.written_parts += 1
+        self.written_rows += len(rows)
@@ -0,0 +1,165 @@
+import os
+import re
+
+from json import dumps, loads
+from typing import Dict, Optional, Tuple
+
+import aiofiles
+
+from httpx import HTTPError
+
+from .logger import get_logger
+from .net_worker import NetWorker
+from .parser import JsonResponseParser
+from .util import get_device_id, json_list, veh_type
+
+
+logger = get_logger()
+
+
+# vehicle type by words in the class name (checked in order, first match wins)
+TYPE_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("motorbike", ("motorbike", "motorcycle", "moto", "motor bike")),
+    ("bus", ("bus", "minibus", "coach")),
+    ("lighttruck", ("lighttruck", "light truck")),
+    ("car", ("car", "passenger")),
+    ("van", ("van",)),
+    ("truck", ("truck", "lorry", "trailer", "semitrailer", "tractor", "hgv", "axles")),
+)
+
+
+def resolve_ucid(ucid: int) -> veh_type:
+    """Built-in ucids, used when the device's class/list does not know the ucid"""
+    if ucid in (1, 3, 4):
+        type_ = f"car"
+    elif ucid in (2, 31, 34, 35, 51, 55, 56,):
+        type_ = f"van"
+    elif ucid in (27, 28, 36, 44, 57,):
+        type_ = f"bus"
+    elif ucid in (30,):
+        type_ = f"motorbike"
+    elif ucid in ():
+        # * there is no class for industrial, as their axles could be anything
+        logger.critical(f"There is no way you got here, ucid: {ucid}")
+        type_ = f"industrial"
+    elif ucid in (5,):
+        type_ = f"lighttruck"
+    elif ucid in (
+        # without image data, there is no real way to differentiate
+        6, 9, 10, 11, 13, 18, 19, 20, 21, 22, 23, 24, 25, 26, 29,
+        32, 38, 39, 40, 41, 42, 43, 50, 52, 53, 54, 60, 61, 63, 64,
+        65, 66, 67, 68, 70, 71, 72, 79, 403, 611, 612, 613, 614, 615,
+    ):
+        type_ = f"truck"
+    else:
+        type_ = "unknown"
+    return (type_, ucid)
+
+
+def classify(class_name: str) -> Optional[str]:
+    """Vehicle type from a class name, None if no keyword matches"""
+    words = set(re.findall(r"[a-z]+", class_name.lower()))
+    for type_, keywords in TYPE_KEYWORDS:
+        if any(set(keyword.split()) <= words for keyword in keywords):
+            return type_
+    return None
+
+
+class ClassTable:
+    """
+    ucid -> vehicle type lookup table compiled from the device's class/list.
+
+    The class list is cached on disk (one file per device, see get_device_id) and revalidated
+    with ETag/Last-Modified on load; the cache is used as is if the device is unreachable.
+
+    Assumed, not documented: the class list is `{"data": [{"ucid", "name"}, ...]}`
+    and the names are English (see TYPE_KEYWORDS). Classes that do not match
+    fall back to resolve_ucid, with a warning.
+    """
+
+    def __init__(self, net_worker: NetWorker, json_parser: JsonResponseParser,
+                 class_list_link: str, cache_dir: str) -> None:
+        self.net_worker = net_worker
+        self.json_parser = json_parser
+        self.link = class_list_link
+        self.cache_path = os.path.join(cache_dir, get_device_id(net_worker.base_url) + ".json")
+        self.table: Dict[int, str] = {}
+
+    async def load(self) -> None:
+        """Fetch (or revalidate) the class list and compile the table"""
+        cache = await self._read_cache()
+        headers: Dict[str, str] = {}
+        if cache is not None:
+            if cache.get("etag"):
+                headers["If-None-Match"] = cache["etag"]
+            if cache.get("last_modified"):
+                headers["If-Modified-Since"] = cache["last_modified"]
+        try:
+            res = await self.net_worker.get_conditional(self.link, headers)
+            if res.status_code == 304 and cache is not None:
+                logger.info("Cached class list is up to date")
+                classes = cache["classes"]
+            elif res.is_success:
+                classes = self.json_parser.get_classes(res.text)
+                await self._write_cache({
+                    "base_url": self.net_worker.base_url,
+                    "etag": res.headers.get("ETag"),
+                    "last_modified": res.headers.get("Last-Modified"),
+                    "classes": classes,
+                })
+            else:
+                raise HTTPError(
+                    f"Server responded with a bad status code: {res.status_code} ({res.reason_phrase})")
+        except (HTTPError, ValueError) as e:
+            logger.error(f"Error getting class list: {repr(e)}, " +
+                         f"url: {self.net_worker.get_full_url(self.link)}")
+            if cache is None:
+                logger.warning("No cached class list, using built-in ucids " +
+                               "(all machines have their class/list json a little different)")
+                return
+            logger.warning("Using cached class list")
+            classes = cache["classes"]
+        self.compile(classes)
+
+    def compile(self, classes: json_list) -> None:
+        table: Dict[int, str] = {}
+        for class_obj in classes:
+            ucid = self.json_parser.get_class_ucid(class_obj)
+            name = self.json_parser.get_class_name(class_obj)
+            if ucid is None or name is None:
+                continue
+            type_ = classify(name)
+            if type_ is None:
+                logger.warning(f"Unknown vehicle type of class {ucid} ({name}), " +
+                               f"using built-in: {resolve_ucid(ucid)[0]}")
+                continue
+            table[ucid] = type_
+        self.table = table
+        logger.info(f"Compiled class table with {len(table)} classes")
+        if len(classes) > 0 and len(table) == 0:
+            logger.warning("No class of the class list matched (different json keys or class names?), " +
+                           "all ucids use the built-in table")
+
+    def resolve(self, ucid: int) -> veh_type:
+        type_ = self.table.get(ucid)
+        if type_ is None:
+            return resolve_ucid(ucid)
+        return (type_, ucid)
+
+    async def _read_cache(self) -> Optional[Dict]:
+        try:
+            async with aiofiles.open(self.cache_path, "r") as file:
+                return loads(await file.read())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Corrupted class list cache {self.cache_path}: {repr(e)}")
+            return None
+
+    async def _write_cache(self, cache: Dict) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            async with aiofiles.open(self.cache_path, "w") as file:
+                await file.write(dumps(cache))
+        except OSError as e:
+            logger.error(f"Error saving class list cache: {repr(e)}")
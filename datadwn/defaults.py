@@ -22,6 +22,27 @@ NET_LEVEL = _NetLevels.ZERO.number  # 0
 DATA_LIMIT = 10  # in mb
 INPUT_FILE = _base_off_cwd(f"..{_sep}vehicles.csv", __file__)
 LINK_VERSION = True
+PLAN = False
+DRY_RUN = False
+PLAN_SAMPLE = 10  # vehicles
+CLASS_CACHE = _base_off_cwd(f"..{_sep}class_cache", __file__)
+TAGS = None  # one view according to TAG_PREFERENCE
+CATALOG = False
+CATALOG_BATCH = 1000  # rows per part file
+PROFILE = False
+PROFILE_SAMPLING = False
+PROFILE_OUTPUT = _base_off_cwd(f"..{_sep}profile", __file__)
+UVLOOP = False
+TIME_FROM = None  # vehicles from input_file
+TIME_TO = None  # now
+WINDOWS = 4
+PAGE_SIZE = 1000  # vehicles
+USERNAME = None  # no authentication
+PASSWORD_ENV = "WIM_PASSWORD"
+
+# fsck.py args
+FSCK_THREADS = 8
+FSCK_CHUNK_SIZE = 256  # files
 
 # image tags
 TAG_PREFERENCE = ("SNAP", "SNAPB")
@@ -1,37 +1,107 @@
+import asyncio
 import os
 
-from typing import List
+from typing import Any, Dict, List, Optional, Set
 
 import aiofiles
 import aiofiles.os
-import aiofiles.ospath
 
+from . import defaults
+from .catalog import Catalog
 from .logger import get_logger
+from .scanner import MANIFEST_NAME, ImageScanner
 
 
 logger = get_logger()
 
 
+MANIFEST_FLUSH = 100  # entries
+PART_SUFFIX = ".part"
+
+
 class ImSaver:
-    def __init__(self, save_dir: str) -> None:
+    def __init__(self, save_dir: str, file_extension: str, catalog: Optional[Catalog] = None) -> None:
+        """
+        With a catalog, catalog rows are always written before the manifest entries
+        of their images (a saved image is skipped on the next run, its row would be lost),
+        the manifest is then written every catalog batch
+        """
         self.save_dir = save_dir
-        self.dir_exist_cache: List[str] = []
+        self.file_extension = file_extension
+        self.dir_exist_cache: Set[str] = set()
+        self.manifest_path = os.path.join(save_dir, MANIFEST_NAME)
+        self._manifest_buffer: List[str] = []
+        self.catalog = catalog
+        self.manifest_flush = MANIFEST_FLUSH if catalog is None else catalog.batch_size
 
     async def ensure_folders_exist(self, path: str) -> None:
         """last path element must be a directory as well"""
         if path not in self.dir_exist_cache:
             await aiofiles.os.makedirs(path, mode=1, exist_ok=True)
-            self.dir_exist_cache.append(path)
+            self.dir_exist_cache.add(path)
 
-    async def save_image(self, imdata: bytes, filepath: str) -> None:
+    async def save_image(self, imdata: bytes, filepath: str,
+                         catalog_row: Optional[Dict[str, Any]] = None) -> None:
         """
         filepath is relative to save_dir (save_dir being / (=root))
-        throws OSError if file already exists
+        overwrites existing files (names are deterministic, skipping is up to the caller)
+        the image is written under a temporary name first, so crashes do not leave truncated images
+        catalog_row is added to the catalog (if any) together with the manifest entry
         """
         image_path = os.path.join(self.save_dir, filepath)
         await self.ensure_folders_exist(os.path.dirname(image_path))
-        if await aiofiles.ospath.exists(image_path):
-            raise OSError(f"File {image_path} already exists")
-        async with aiofiles.open(image_path, "wb") as imfile:
+        async with aiofiles.open(image_path + PART_SUFFIX, "wb") as imfile:
             await imfile.write(imdata)
-            logger.info(f"Saved image to {image_path}")
+        await aiofiles.os.replace(image_path + PART_SUFFIX, image_path)
+        logger.info(f"Saved image to {image_path}")
+        if self.catalog is not None and catalog_row is not None:
+            self.catalog.append(catalog_row)
+        self._manifest_buffer.append(filepath)
+        if len(self._manifest_buffer) >= self.manifest_flush:
+            await self.flush_manifest()
+
+    async def load_saved(self) -> List[str]:
+        """
+        Paths (relative to save_dir) of already saved images.
+        Read from the manifest; without one save_dir is walked once (the same way as fsck.py,
+        without checking the images) and the manifest is written.
+        """
+        try:
+            async with aiofiles.open(self.manifest_path, "r") as file:
+                saved = (await file.read()).splitlines()
+            logger.info(f"{len(saved)} saved images in {self.manifest_path}")
+            return saved
+        except FileNotFoundError:
+            pass
+        if not os.path.isdir(self.save_dir):
+            return []
+        logger.info(f"No manifest, scanning {self.save_dir}")
+        saved = await asyncio.get_running_loop().run_in_executor(None, self._walk_saved)
+        logger.info(f"{len(saved)} saved images in {self.save_dir}")
+        return saved
+
+    async def flush_manifest(self) -> None:
+        if len(self._manifest_buffer) == 0:
+            return
+        entries, self._manifest_buffer = self._manifest_buffer, []
+        if self.catalog is not None:
+            # rows of the entries were added before them, they are all in this flush
+            await self.catalog.flush()
+        await self.ensure_folders_exist(self.save_dir)
+        async with aiofiles.open(self.manifest_path, "a") as file:
+            await file.write("".join(entry + "\n" for entry in entries))
+
+    async def close(self) -> None:
+        await self.flush_manifest()
+
+    def _walk_saved(self) -> List[str]:
+        """Walk save_dir for images (.part files do not have the extension), write the manifest"""
+        scanner = ImageScanner(self.save_dir, self.file_extension, processes=1,
+                               threads=defaults.FSCK_THREADS, chunk_size=defaults.FSCK_CHUNK_SIZE)
+        saved: List[str] = []
+        with open(self.manifest_path + ".tmp", "w") as file:
+            for path in scanner.walk():
+                file.write(path + "\n")
+                saved.append(path)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        return saved
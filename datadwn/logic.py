@@ -4,21 +4,36 @@ import os
 import random
 import time
 
+from datetime import datetime
 from hashlib import md5
+from io import StringIO
 from string import ascii_lowercase
-from typing import Dict, Optional
+from typing import Any, AsyncIterator, Counter, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlencode
 
+import pandas as pd
+
+from aioconsole import ainput
 from httpx import HTTPError
 
+from .catalog import Catalog
+from .classes import ClassTable
 from .defaults import TAG_PREFERENCE
 from .im_saver import ImSaver
 from .logger import get_logger
 from .net_worker import NetLevels, NetWorker
 from .parser import CsvResponseParser, JsonResponseParser
-from .util import json_list, json_obj, t_row, veh_type
+from .planner import Plan, PlanSample
+from .profiler import get_profiler
+from .util import get_device_id, json_list, json_obj, t_row, table
 
 
 logger = get_logger()
+profiler = get_profiler()
+
+
+LIST_ATTEMPTS = 3  # per page of the vehicle list
+LIST_RETRY_DELAY = 1.0  # seconds, times the attempt number
 
 
 # intellisense, types, overview of args
@@ -33,21 +48,53 @@ class DownloaderArgs(argparse.Namespace):
     net_level: int
     data_limit: int
     link_has_number: bool
+    plan: bool
+    dry_run: bool
+    plan_sample: int
+    class_cache: str
+    tags: Optional[List[str]]
+    catalog: bool
+    catalog_batch: int
+    profile: bool
+    profile_sampling: bool
+    profile_output: str
+    uvloop: bool
+    time_from: Optional[datetime]
+    time_to: Optional[datetime]
+    windows: int
+    page_size: int
+    username: Optional[str]
+    password: Optional[str]
 
 
 class Downloader:
     def __init__(self, args: DownloaderArgs):
-        logger.warning(
-            "Classes ucids may be different than seen " +
-            "(all machines have their class/list json a little different)")
         # * info counters
         self.parsed_vehicles = 0
         self.downloaded_images = 0
         self.saved_images = 0
+        self.skipped_vehicles = 0
+        # per tag (only with multiple views)
+        self.downloaded_per_tag: Counter[Optional[str]] = Counter()
+        self.saved_per_tag: Counter[Optional[str]] = Counter()
 
         # * worker objects
         self.csv_parser = CsvResponseParser()
-        self.vehicles = self.csv_parser.get_vehicles(args.input_file)
+        # * vehicles from the csv file, or listed from the API by time window (see _list_window)
+        self.time_window: Optional[Tuple[datetime, datetime]] = None
+        self.vehicles: Optional[table] = None
+        # saved images are told apart per device (see get_file_key)
+        self.device = get_device_id(args.base_url)
+        if args.time_from is None:
+            self.vehicles = self.csv_parser.add_file_stems(
+                self.csv_parser.get_vehicles(args.input_file), self.device)
+        else:
+            # now in the time zone of time_from (aware and naive datetimes can not be compared)
+            self.time_window = (args.time_from, args.time_to or datetime.now(args.time_from.tzinfo))
+        self.windows = args.windows
+        self.page_size = args.page_size
+        self.username = args.username
+        self.password = args.password
         self.net_worker = NetWorker(
             args.base_url,
             NetLevels.ALL_LEVELS[args.net_level],
@@ -56,31 +103,234 @@ class Downloader:
             args.verify_ssl,
         )
         self.json_parser = JsonResponseParser()
+        self.link_has_version = args.link_has_number
+        self.class_table = ClassTable(self.net_worker, self.json_parser,
+                                      self._create_class_list_link(), args.class_cache)
         if args.loc_code is None:
             args.loc_code = "".join(random.choice(ascii_lowercase)
                                     for _ in range(2))
             logger.info(f"Random file prefix: {args.loc_code}")
         self.director = LocTypeDirector(self.json_parser, args.file_extension,
-                                        args.loc_code)
-        self.saver = ImSaver(args.save_dir)
-        self.link_has_version = args.link_has_number
+                                        args.loc_code, self.class_table)
+        self.catalog = Catalog(os.path.join(args.save_dir, "catalog"), args.catalog_batch) \
+            if args.catalog else None
+        self.saver = ImSaver(args.save_dir, args.file_extension, self.catalog)
+        # file keys (see get_file_key) of already saved images
+        self.saved_keys: Set[str] = set()
+        # (start, end, page) of sub-windows that stopped at a page that could not be listed
+        self.missed_pages: List[Tuple[datetime, datetime, int]] = []
+        self.dry_run = args.dry_run
+        self.ask_plan = args.plan or args.dry_run
+        self.plan_sample = args.plan_sample
+        # None -> one view according to TAG_PREFERENCE
+        self.tags = args.tags
 
     async def get_images(self) -> None:
         start = time.perf_counter()
         try:
-            await asyncio.gather(*(
-                self.get_image(vehicle) for vehicle  # type: ignore[arg-type]
-                in self.vehicles.itertuples(name="Vehicle")
-            ))
+            if self.username is not None and not await self._login():
+                return
+            await self.class_table.load()
+            self.saved_keys = {get_file_key_from_path(path)
+                               for path in await self.saver.load_saved()}
+            if self.vehicles is None and not self.ask_plan:
+                # pages of the listing go into the pipeline as they arrive
+                await self._get_listed_images()
+            else:
+                if self.vehicles is None:
+                    # the plan needs all vehicles up front
+                    self.vehicles = await self._list_all_vehicles()
+                    if self.vehicles is None:
+                        return
+                self.vehicles = self._drop_saved(self.vehicles)
+                if self.ask_plan and not await self._confirm_plan():
+                    return
+                await self._get_images_of(self.vehicles)
         finally:
             # we have to close the connection
             await self.net_worker.close_connection()
+            # writes the remaining catalog rows first
+            await self.saver.close()
+            if self.catalog is not None:
+                await self.catalog.close()
+            self._log_missed_pages()
         logger.success("Finished!")
+        logger.info(f"Skipped (already saved) vehicles: {self.skipped_vehicles}")
         logger.info(f"Parsed vehicles: {self.parsed_vehicles}")
         logger.info(
             f"Saved {self.saved_images}/{self.downloaded_images} images")
+        if self.tags is not None:
+            for tag in self.tags:
+                logger.info(
+                    f"[{tag}] Saved {self.saved_per_tag[tag]}/{self.downloaded_per_tag[tag]} images")
         logger.info(f"Took: {time.perf_counter() - start:.2f}s")
 
+    async def _get_images_of(self, vehicles: table) -> None:
+        await asyncio.gather(*(
+            self.get_image(vehicle) for vehicle  # type: ignore[arg-type]
+            in vehicles.itertuples(name="Vehicle")
+        ))
+
+    def _drop_saved(self, vehicles: table) -> table:
+        """Leave out vehicles with all views saved (file names are deterministic, no file system checks)"""
+        if len(self.saved_keys) == 0:
+            return vehicles
+        ids = f"{self.device}-" + vehicles["vehicleId"].astype(str)
+        done = None
+        for tag in (self.tags or [None]):
+            saved = (ids if tag is None else ids + f"_{tag}").isin(self.saved_keys)
+            done = saved if done is None else done & saved
+        skipped = int(done.sum())
+        if skipped > 0:
+            self.skipped_vehicles += skipped
+            logger.info(f"Skipping {skipped} already saved vehicles")
+        return vehicles[~done]
+
+    async def _login(self) -> bool:
+        try:
+            await self.net_worker.login(self._create_login_link(),
+                                        self.username or "", self.password or "")
+        except (HTTPError, ValueError) as e:
+            logger.critical(f"Could not log in: {repr(e)}, " +
+                            f"url: {self.net_worker.get_full_url(self._create_login_link())}")
+            return False
+        return True
+
+    def _sub_windows(self) -> List[Tuple[datetime, datetime]]:
+        """Split the time window into self.windows parts (listed in parallel)"""
+        assert self.time_window is not None
+        start, end = self.time_window
+        step = (end - start) / self.windows
+        bounds = [start + step * i for i in range(self.windows)] + [end]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    async def _list_window(self, start: datetime, end: datetime) -> AsyncIterator[table]:
+        """
+        Yield pages of vehicles in [start, end), one request per page.
+        Stops at a page that can not be listed (recorded in missed_pages)
+        """
+        page = 0
+        while True:
+            vehicles = await self._list_page(self._create_list_link(start, end, page))
+            if vehicles is None:
+                logger.error(f"Giving up on listing {start} - {end} from page {page}")
+                self.missed_pages.append((start, end, page))
+                return
+            logger.info(f"Listed {len(vehicles)} vehicles ({start} - {end}, page {page})")
+            if len(vehicles) > 0:
+                yield self.csv_parser.add_file_stems(vehicles, self.device)
+            if len(vehicles) < self.page_size:
+                return
+            page += 1
+
+    async def _list_page(self, list_link: str) -> Optional[table]:
+        """Vehicles of one page, None if not listed after LIST_ATTEMPTS attempts (or not sent)"""
+        for attempt in range(1, LIST_ATTEMPTS + 1):
+            try:
+                res = await self.net_worker.get(list_link)
+                if self.net_worker.is_not_sent(res):
+                    return None
+                if not res.is_success:
+                    raise HTTPError(
+                        f"Server responded with a bad status code: {res.status_code} ({res.reason_phrase})")
+                return self.csv_parser.get_vehicles(StringIO(res.text))
+            except (HTTPError, ValueError) as e:
+                logger.error(f"Error listing vehicles (attempt {attempt}/{LIST_ATTEMPTS}): {repr(e)}, " +
+                             f"url: {self.net_worker.get_full_url(list_link)}")
+            if attempt < LIST_ATTEMPTS:
+                await asyncio.sleep(LIST_RETRY_DELAY * attempt)
+        return None
+
+    def _log_missed_pages(self) -> None:
+        if len(self.missed_pages) == 0:
+            return
+        logger.error(f"Listing is incomplete, {len(self.missed_pages)} sub-windows were not listed " +
+                     "to the end (run the same time window again, saved vehicles are skipped):")
+        for start, end, page in sorted(self.missed_pages):
+            logger.error(f"  {start} - {end} from page {page}")
+
+    async def _get_listed_images(self) -> None:
+        page_tasks: List[asyncio.Future] = []
+
+        async def stream_window(start: datetime, end: datetime) -> None:
+            async for vehicles in self._list_window(start, end):
+                # do not wait for the images, get the next page right away
+                page_tasks.append(asyncio.ensure_future(
+                    self._get_images_of(self._drop_saved(vehicles))))
+
+        await asyncio.gather(*(stream_window(start, end) for start, end in self._sub_windows()))
+        await asyncio.gather(*page_tasks)
+
+    async def _list_all_vehicles(self) -> Optional[table]:
+        pages: List[table] = []
+
+        async def list_window(start: datetime, end: datetime) -> None:
+            async for vehicles in self._list_window(start, end):
+                pages.append(vehicles)
+
+        await asyncio.gather(*(list_window(start, end) for start, end in self._sub_windows()))
+        if len(pages) == 0:
+            logger.warning("No vehicles in the time window")
+            return None
+        return pd.concat(pages, ignore_index=True)
+
+    async def plan(self) -> Plan:
+        """Estimate the run from a sample of vehicles (uses the net worker, but never asks)"""
+        sample = PlanSample()
+        sample_size = min(self.plan_sample, len(self.vehicles))
+        rows = self.vehicles.sample(n=sample_size, random_state=0)
+        await asyncio.gather(*(
+            self._sample_vehicle(vehicle, sample) for vehicle  # type: ignore[arg-type]
+            in rows.itertuples(name="Vehicle")
+        ))
+        images_per_vehicle = 1 if self.tags is None else len(self.tags)
+        return sample.estimate(len(self.vehicles), images_per_vehicle, self.net_worker)
+
+    async def _confirm_plan(self) -> bool:
+        """Show the plan and ask once for the whole run, True if approved"""
+        plan = await self.plan()
+        logger.important(f"Download plan:\n{plan.describe()}")
+        if self.dry_run:
+            logger.info("Dry run, not downloading")
+            return False
+        i_res = (await ainput("Proceed with the plan? (Y/n): ")).lower()
+        if i_res != "y":
+            logger.info("Plan not approved, not downloading")
+            return False
+        self.net_worker.approve()
+        return True
+
+    async def _sample_vehicle(self, veh_row: t_row, sample: PlanSample) -> None:
+        v_id = self.csv_parser.get_id(veh_row)
+        if v_id is None:
+            return
+        sample.vehicles += 1
+        try:
+            res = await self.net_worker.get(self._create_json_link(v_id), bypass=True)
+            if not res.is_success:
+                return
+            sample.json_sizes.append(len(res.content))
+            sample.latencies.append(res.elapsed.total_seconds())
+            image_links = self._get_image_links(self.json_parser.get_vehicle(res.text))
+            sample.image_links += len(image_links)
+            await asyncio.gather(*(
+                self._sample_image(image_link, sample) for image_link in image_links.values()
+            ))
+        except (HTTPError, ValueError) as e:
+            logger.warning(f"Error sampling vehicle {v_id}: {repr(e)}")
+
+    async def _sample_image(self, image_link: str, sample: PlanSample) -> None:
+        res = await self.net_worker.head(image_link)
+        length = res.headers.get("Content-Length")
+        if not res.is_success or length is None:
+            # HEAD not supported, sample the image itself
+            res = await self.net_worker.get(image_link, bypass=True)
+            if not res.is_success:
+                return
+            sample.latencies.append(res.elapsed.total_seconds())
+            length = len(res.content)
+        sample.image_sizes.append(int(length))
+
     # ENHANCE: move to functions, use df.apply
     async def get_image(self, veh_row: t_row) -> None:
         # TODO: filter vehicle
@@ -88,7 +338,8 @@ class Downloader:
         # moc disku -> mažou zbytek
         # * get json link
         v_id = self.csv_parser.get_id(veh_row)
-        if v_id is None:
+        file_stem = self.csv_parser.get_file_stem(veh_row)
+        if v_id is None or file_stem is None:
             return
         json_link = self._create_json_link(v_id)
         # * download json
@@ -100,14 +351,22 @@ class Downloader:
             logger.error(f"Error downloading json: {repr(e)}, " +
                          f"url: {self.net_worker.get_full_url(json_link)}")
             return
-        # * get image link
+        # * get image links
         try:
-            image_link = get_preferred_view_link(
-                self.json_parser.get_images(veh_json))
+            image_links = self._get_image_links(veh_json)
         except ValueError as e:
             logger.error(f"Error getting image url: {repr(e)}")
             return
         self.parsed_vehicles += 1
+        # * download and save all (not yet saved) views at once
+        await asyncio.gather(*(
+            self._get_view(v_id, file_stem, veh_json, tag, image_link)
+            for tag, image_link in image_links.items()
+            if get_file_key(self.device, v_id, tag) not in self.saved_keys
+        ))
+
+    async def _get_view(self, v_id: int, file_stem: str, veh_json: json_obj,
+                        tag: Optional[str], image_link: str) -> None:
         # * download image
         try:
             image = await self._download_image(image_link)
@@ -118,21 +377,68 @@ class Downloader:
                          f"url: {self.net_worker.get_full_url(image_link)}")
             return
         self.downloaded_images += 1
+        self.downloaded_per_tag[tag] += 1
         # TODO: filter image
         # * save image
-        image_path = self.director.get_imsavepath(veh_json, image)
+        with profiler.stage("director"):
+            image_path = self.director.get_imsavepath(veh_json, file_stem, tag)
+        row = None
+        if self.catalog is not None:
+            with profiler.stage("catalog_row"):
+                row = self._catalog_row(v_id, veh_json, tag, image_path, image)
         try:
-            await self.saver.save_image(image, image_path)
+            with profiler.stage("save", cpu=False):
+                await self.saver.save_image(image, image_path, row)
         except OSError as e:
             logger.error(f"Error saving image: {repr(e)}")
             return
         self.saved_images += 1
+        self.saved_per_tag[tag] += 1
+
+    def _catalog_row(self, v_id: int, veh_json: json_obj, tag: Optional[str],
+                     image_path: str, image: bytes) -> Dict[str, Any]:
+        ucid = self.json_parser.get_ucid(veh_json)
+        return {
+            "vehicleId": int(v_id),
+            "ucid": ucid,
+            "type": "unknown" if ucid is None else self.class_table.resolve(ucid)[0],
+            "lane": self.json_parser.get_lane(veh_json),
+            "timestamp": self.json_parser.get_timestamp(veh_json),
+            "gvw": self.json_parser.get_gvw(veh_json),
+            "length": self.json_parser.get_length(veh_json),
+            "flags": self.json_parser.get_flags(veh_json),
+            "tag": tag,
+            "path": image_path,
+            "size": len(image),
+            "md5": md5(image).hexdigest(),
+        }
+
+    def _get_image_links(self, veh_json: json_obj) -> Dict[Optional[str], str]:
+        """
+        tag -> url of views to download (tag None for the single preferred view)
+        raises ValueError if there is nothing to download
+        """
+        images_list = self.json_parser.get_images(veh_json)
+        if self.tags is None:
+            return {None: get_preferred_view_link(images_list)}
+        return get_view_links(images_list, self.tags)
 
     def _create_json_link(self, id: int) -> str:
         # TODO: does every cam leave API version out of the link in vehicle/detail?
         # ? probably not -> self.link_has_version
         return f"/api{'/1.0' if self.link_has_version else ''}/vehicle/detail?id={id}"
 
+    def _create_class_list_link(self) -> str:
+        return f"/api{'/1.0' if self.link_has_version else ''}/class/list"
+
+    def _create_login_link(self) -> str:
+        return f"/api{'/1.0' if self.link_has_version else ''}/auth/login"
+
+    def _create_list_link(self, start: datetime, end: datetime, page: int) -> str:
+        query = urlencode({"from": start.isoformat(), "to": end.isoformat(),
+                           "page": page, "pageSize": self.page_size, "format": "csv"})
+        return f"/api{'/1.0' if self.link_has_version else ''}/vehicle/list?{query}"
+
     async def _download_image(self, api_url: str) -> bytes:
         """Raises HTTPError if response is not 2**"""
         res = await self.net_worker.get(api_url)
@@ -168,44 +474,50 @@ def get_preferred_view_link(images_list: json_list) -> str:
                      f"known usable tags: {TAG_PREFERENCE}")
 
 
-def resolve_ucid(ucid: int) -> veh_type:
-    if ucid in (1, 3, 4):
-        type_ = f"car"
-    elif ucid in (2, 31, 34, 35, 51, 55, 56,):
-        type_ = f"van"
-    elif ucid in (27, 28, 36, 44, 57,):
-        type_ = f"bus"
-    elif ucid in (30,):
-        type_ = f"motorbike"
-    elif ucid in ():
-        # * there is no class for industrial, as their axles could be anything
-        logger.critical(f"There is no way you got here, ucid: {ucid}")
-        type_ = f"industrial"
-    elif ucid in (5,):
-        type_ = f"lighttruck"
-    elif ucid in (
-        # without image data, there is no real way to differentiate
-        6, 9, 10, 11, 13, 18, 19, 20, 21, 22, 23, 24, 25, 26, 29,
-        32, 38, 39, 40, 41, 42, 43, 50, 52, 53, 54, 60, 61, 63, 64,
-        65, 66, 67, 68, 70, 71, 72, 79, 403, 611, 612, 613, 614, 615,
-    ):
-        type_ = f"truck"
-    else:
-        type_ = "unknown"
-    return (type_, ucid)
+def get_view_links(images_list: json_list, tags: List[str]) -> Dict[Optional[str], str]:
+    """raises ValueEror if none of the tags is in the list"""
+    images_dict: Dict[str, str] = {}
+    for image_obj in images_list:
+        images_dict[image_obj["tag"]] = image_obj["url"]
+    links: Dict[Optional[str], str] = {}
+    for tag in tags:
+        if tag in images_dict.keys():
+            links[tag] = images_dict[tag]
+        else:
+            logger.info(f"key [{tag}] not in images")
+    if len(links) == 0:
+        raise ValueError(f"No requested tags in image list: {images_list}, " +
+                         f"requested tags: {tags}")
+    return links
+
+
+def get_file_key(device: str, v_id: int, tag: Optional[str]) -> str:
+    """Identifies a saved image, the end of its file name (see LocTypeDirector)"""
+    return f"{device}-{v_id}" if tag is None else f"{device}-{v_id}_{tag}"
+
+
+def get_file_key_from_path(path: str) -> str:
+    """file key of a path created by LocTypeDirector (no matter the os separators)"""
+    name = path.replace("\\", "/").rsplit("/", 1)[-1]
+    return name.rsplit(".", 1)[0].rsplit("#", 1)[-1]
 
 
 class LocTypeDirector():
     def __init__(self, json_parser: JsonResponseParser, file_extension: str,
-                 default_loc_code: str) -> None:
+                 default_loc_code: str, class_table: ClassTable) -> None:
         self.json_parser = json_parser
         self.file_ext = file_extension
         self.loc_code = default_loc_code
+        self.class_table = class_table
 
-    def get_imsavepath(self, vehicle: json_obj, image: bytes) -> str:
+    def get_imsavepath(self, vehicle: json_obj, file_stem: str, tag: Optional[str] = None) -> str:
+        """
+        file_stem comes from the csv (see CsvResponseParser.add_file_stems),
+        tag is added to the file name (multiple views of one vehicle)
+        """
         ucid = self.json_parser.get_ucid(vehicle)
         v_type, id_ = ("unknown", "unknown") if ucid is None \
-            else resolve_ucid(ucid)
+            else self.class_table.resolve(ucid)
         type_dir = f"{v_type}\\{id_}"
         l_code = self.json_parser.get_lane_description(vehicle)
         if l_code is None:
@@ -215,16 +527,6 @@ class LocTypeDirector():
         lane = self.json_parser.get_lane(vehicle)
         if lane is not None:
             l_code += "_" + lane
-        # ENHANCE: better time processing
-        timestamp = self.json_parser.get_timestamp(vehicle)
-        if timestamp is None:
-            timestamp = md5(image).hexdigest()[:6] +\
-                "".join(random.choice(ascii_lowercase) for _ in range(6))
-        else:
-            timestamp = timestamp\
-                .replace(":", "")\
-                .replace("-", "")\
-                .rsplit("+", 1)[0][:-3]
         final_path = os.path.join(l_code, type_dir,
-                                  f"{l_code}#{timestamp}.{self.file_ext}")
+                                  f"{l_code}#{file_stem}{'' if tag is None else '_' + tag}.{self.file_ext}")
         return final_path
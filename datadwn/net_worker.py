@@ -2,22 +2,28 @@ import asyncio
 
 from dataclasses import dataclass
 from time import time
-from typing import Any, Coroutine
+from typing import Any, Coroutine, Dict, List, Optional, Tuple
 
 import httpx
 
 from aioconsole import ainput
 
 from .logger import get_logger
+from .profiler import get_profiler
 from .util import round_to_digits
 
 
 logger = get_logger()
+profiler = get_profiler()
 
 
 MAX_REQUEST_LIMIT = 10
 
 
+class _OverLimit(Exception):
+    """A budgeted download does not fit into data_limit (level 1)"""
+
+
 # net levels (for bandwith and data saving)
 @dataclass(frozen=True)
 class NetworkLevel:
@@ -55,17 +61,24 @@ class NetWorker:
         # * proceed with initialization like normal
         self.base_url = base_url
         self.verify = verify
+        # * session (see login), kept when the client is recreated
+        self.auth_headers: Dict[str, str] = {}
+        self._credentials: Optional[Tuple[str, str, str]] = None
+        self._login_lock = asyncio.Lock()
         self.__init_client()
         self.level = net_level
         self.__init_net_level(download_delay, data_limit)
         self.flying_requests = 0
-        self._flying_lock = asyncio.Lock()
+        # set by approve(), after a plan was confirmed as a whole
+        self.approved = False
+        # at most MAX_REQUEST_LIMIT requests in the air at once
+        self._flying_lock = asyncio.Semaphore(MAX_REQUEST_LIMIT)
         logger.debug(
             f"Initialized {type(self).__name__} with NetLevel {net_level.number}")
 
     def __init_client(self) -> None:
-        self.client = httpx.AsyncClient(follow_redirects=True,
-                                        base_url=self.base_url, verify=self.verify)
+        self.client = httpx.AsyncClient(follow_redirects=True, base_url=self.base_url,
+                                        verify=self.verify, headers=self.auth_headers)
 
     def __init_net_level(self, download_delay: float, data_limit: int):
         if self.level == NetLevels.ZERO:
@@ -73,7 +86,8 @@ class NetWorker:
         elif self.level == NetLevels.ONE:
             self.data_limit = data_limit
             self.used_data = 0
-            self._count_lock = asyncio.Lock()
+            # bytes of requests in progress (Content-Length), see _budgeted_get
+            self.reserved_data = 0
             self._get_func = self._get_level_1
         elif self.level == NetLevels.TWO:
             self._get_func = self._get_level_2
@@ -128,18 +142,101 @@ class NetWorker:
         *Might throw ConnectError* (or other unseen one)
         """
         if not bypass:
-            f = self._get_func
-        elif self.level == NetLevels.THREE:
-            f = self._get_level_3
-        else:
-            f = self._get_level_2
-        return f(api_url)
+            return self._get_func(api_url)
+        if self.level == NetLevels.THREE:
+            return self._get_level_3(api_url)
+        return self._get_level_2(api_url)
+
+    def get_conditional(self, api_url: str,
+                        headers: Dict[str, str]) -> Coroutine[Any, Any, httpx.Response]:
+        """
+        GET an api url with extra (If-None-Match, If-Modified-Since, ...) headers asyncronously
+        (never asks, respects download_delay if level < 3).
+
+        *Might throw ConnectError* (or other unseen one)
+        """
+        if self.level == NetLevels.THREE:
+            return self._get_level_3(api_url, headers=headers)
+        return self._get_level_2(api_url, headers=headers)
+
+    def head(self, api_url: str) -> Coroutine[Any, Any, httpx.Response]:
+        """
+        HEAD an api url asyncronously (never asks, respects download_delay if level < 3).
+
+        *Might throw ConnectError* (or other unseen one)
+        """
+        if self.level == NetLevels.THREE:
+            return self._get_level_3(api_url, "HEAD")
+        return self._get_level_2(api_url, "HEAD")
+
+    async def login(self, login_link: str, username: str, password: str) -> None:
+        """
+        Log in once, the token (and session cookies) are reused by all following requests.
+        Requests answered with 401 log in again (once for all of them) and are retried.
+
+        Raises HTTPError if login fails, ValueError if the response has no token
+        """
+        self._credentials = (login_link, username, password)
+        await self._login()
+
+    async def _login(self) -> None:
+        assert self._credentials is not None
+        login_link, username, password = self._credentials
+        logger.important(f"POST: {self.get_full_url(login_link)}")
+        res = await self.client.post(login_link, json={"username": username, "password": password})
+        if not res.is_success:
+            logger.error(f"Login failed: {res.status_code} ({res.reason_phrase})")
+            raise httpx.HTTPError(
+                f"Login failed with a bad status code: {res.status_code} ({res.reason_phrase})")
+        try:
+            token = res.json()["data"]["token"]
+        except (KeyError, TypeError):
+            logger.debug(f"Object: {res.text}")
+            raise ValueError("Token not in login response")
+        self.auth_headers["Authorization"] = f"Bearer {token}"
+        self.client.headers.update(self.auth_headers)
+        logger.info("Logged in")
+
+    async def _relogin(self, stale_auth: Optional[str]) -> None:
+        async with self._login_lock:
+            if self.auth_headers.get("Authorization") != stale_auth:
+                # another request already logged in again
+                return
+            logger.warning("Session expired, logging in again")
+            await self._login()
+
+    def approve(self) -> None:
+        """
+        Approve the whole run at once (after confirming a plan).
+        Level 0 stops asking before every download and level 1 skips
+        downloads over the limit instead of asking.
+        """
+        self.approved = True
+        logger.info("Run approved, not asking before downloads")
+
+    def estimate_duration(self, requests: int, latency: float) -> float:
+        """Estimate wall time (in seconds) of `requests` requests with average `latency`"""
+        if self.level == NetLevels.THREE:
+            return requests * latency / MAX_REQUEST_LIMIT
+        if self.level == NetLevels.ONE:
+            # only the starts are download_delay apart, the requests run concurrently
+            return max(requests * self.delay, requests * latency / MAX_REQUEST_LIMIT)
+        # requests are serialized, with download_delay after each one
+        return requests * (latency + self.delay)
 
     def _not_sent_response(self, api_url: str) -> httpx.Response:
-        return httpx.Response(412, request=httpx.Request(method="GET", url=self.get_full_url(api_url)))
+        return httpx.Response(412, request=httpx.Request(method="GET", url=self.get_full_url(api_url)),
+                              extensions={"not_sent": True})
+
+    @staticmethod
+    def is_not_sent(res: httpx.Response) -> bool:
+        """Whether the request was not sent (declined, over the limit), not a response of the server"""
+        return res.extensions.get("not_sent", False)
 
     async def _get_level_0(self, api_url: str) -> httpx.Response:
-        async with self._ask_lock:
+        if self.approved:
+            return await self._get_level_2(api_url)
+        async with profiler.locked("_ask_lock", self._ask_lock):
             # ENHANCE: allow to answer multiple questions at once (10y or 5y5n for instance)
             # ENHANCE: figure out how to use ainput without logs flooding the input field
             i_res = (await ainput(f"Download {self.get_full_url(api_url)}? (Y/n): ")).lower()
@@ -150,51 +247,129 @@ class NetWorker:
             return self._not_sent_response(api_url)
 
     async def _get_level_1(self, api_url: str) -> httpx.Response:
-        async with self._count_lock:
-            if self.used_data > self.data_limit:
-                logger.warning(
-                    f"Downloads over the limit! ({self.used_data}/{self.data_limit} bytes)")
-                res = await self._get_level_0(api_url)
-            else:
-                res = await self._get_level_2(api_url)
-            self.used_data += len(res.content)
-            logger.info(
-                f"Used data so far: {self.used_data}/{self.data_limit} bytes")
+        if self.used_data + self.reserved_data >= self.data_limit:
+            return await self._get_over_limit(api_url)
+        # only the starts of requests are delayed, the downloads run concurrently
+        async with profiler.locked("_get_lock", self._get_lock):
+            await self._wait_delay()
+            self.last_request = time()
+        try:
+            return await self._get_level_3(api_url, budgeted=True)
+        except _OverLimit:
+            # the same as if the limit was reached before the request
+            return await self._get_over_limit(api_url)
+
+    async def _get_over_limit(self, api_url: str) -> httpx.Response:
+        """Skip the download in an approved run, otherwise ask (level 0)"""
+        logger.warning(
+            f"Downloads over the limit! ({self.used_data}/{self.data_limit} bytes)")
+        if self.approved:
+            logger.info(f"Not getting {self.get_full_url(api_url)}")
+            return self._not_sent_response(api_url)
+        res = await self._get_level_0(api_url)
+        self.used_data += len(res.content)
         return res
 
-    async def _get_level_2(self, api_url: str) -> httpx.Response:
-        async with self._get_lock:
-            sleep_dur = self.last_request + self.delay - time()
-            if sleep_dur > 0:
-                logger.info(f"sleeping for {round_to_digits(sleep_dur, 3)} s")
-                await asyncio.sleep(sleep_dur)
-            r = await self._get_level_3(api_url)
+    async def _get_level_2(self, api_url: str, method: str = "GET",
+                           headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        async with profiler.locked("_get_lock", self._get_lock):
+            await self._wait_delay()
+            r = await self._get_level_3(api_url, method, headers=headers)
             self.last_request = time()
         return r
 
-    async def _get_level_3(self, api_url: str) -> httpx.Response:
-        if self.flying_requests >= (MAX_REQUEST_LIMIT - 1):
+    async def _get_level_3(self, api_url: str, method: str = "GET", budgeted: bool = False,
+                           headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        if self._flying_lock.locked():
             logger.info("Waiting for requests to finish")
             logger.debug(f"Currrently flying requests: {self.flying_requests}")
-            await self._flying_lock.acquire()
-        self.flying_requests += 1
-        try:
-            res = await self._actual_get(api_url)
-            return res
-        finally:
-            if self.flying_requests == MAX_REQUEST_LIMIT:
-                self._flying_lock.release()
-            self.flying_requests -= 1
-
-    async def _actual_get(self, api_url: str) -> httpx.Response:
+        async with profiler.locked("_flying_lock", self._flying_lock):
+            self.flying_requests += 1
+            try:
+                with profiler.stage("network", cpu=False):
+                    res = await self._send(api_url, method, budgeted, headers)
+                    if res.status_code == 401 and self._credentials is not None:
+                        await self._relogin(res.request.headers.get("Authorization"))
+                        res = await self._send(api_url, method, budgeted, headers)
+                    return res
+            finally:
+                self.flying_requests -= 1
+
+    def _send(self, api_url: str, method: str, budgeted: bool,
+              headers: Optional[Dict[str, str]]) -> Coroutine[Any, Any, httpx.Response]:
+        if budgeted:
+            return self._budgeted_get(api_url)
+        return self._actual_get(api_url, method, headers)
+
+    async def _wait_delay(self) -> None:
+        """Sleep until download_delay passed since the last request (hold _get_lock)"""
+        sleep_dur = self.last_request + self.delay - time()
+        if sleep_dur > 0:
+            logger.info(f"sleeping for {round_to_digits(sleep_dur, 3)} s")
+            await asyncio.sleep(sleep_dur)
+
+    def _reserve(self, size: int) -> bool:
+        """Reserve size bytes of data_limit, False if it does not fit"""
+        # no await in here, so no other request can reserve in between
+        if self.used_data + self.reserved_data + size > self.data_limit:
+            return False
+        self.reserved_data += size
+        return True
+
+    async def _budgeted_get(self, api_url: str) -> httpx.Response:
+        """
+        GET counting the body against data_limit (level 1).
+
+        Content-Length is reserved before the body is read, the body is not read if it does not fit.
+        Bytes over the reservation (no or wrong Content-Length) are reserved while streaming,
+        the download is aborted once they do not fit.
+        Actual bytes replace the reservation when the request is done.
+
+        Raises _OverLimit if the body does not fit
+        """
         logger.important(f"GET: {self.get_full_url(api_url)}")
+        if self.client.is_closed:
+            logger.warning("Client already closed")
+            logger.info("Creating a new client")
+            self.__init_client()
+        async with self.client.stream("GET", api_url) as res:
+            length = res.headers.get("Content-Length", "")
+            reserved = int(length) if length.isdigit() else 0
+            if not self._reserve(reserved):
+                logger.info(f"Not reading {self.get_full_url(api_url)}, " +
+                            f"{reserved} bytes would exceed the limit")
+                raise _OverLimit(api_url)
+            received = 0
+            chunks: List[bytes] = []
+            try:
+                async for chunk in res.aiter_raw():
+                    received += len(chunk)
+                    if received > reserved:
+                        if not self._reserve(received - reserved):
+                            logger.info(f"Aborted {self.get_full_url(api_url)}, " +
+                                        f"exceeded the limit after {received} bytes")
+                            raise _OverLimit(api_url)
+                        reserved = received
+                    chunks.append(chunk)
+            finally:
+                self.reserved_data -= reserved
+                self.used_data += received
+                logger.info(
+                    f"Used data so far: {self.used_data}/{self.data_limit} bytes")
+        # raw (still encoded) body, the new response decodes it according to the headers
+        return httpx.Response(res.status_code, headers=res.headers,
+                              content=b"".join(chunks), request=res.request)
+
+    async def _actual_get(self, api_url: str, method: str = "GET",
+                          headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        logger.important(f"{method}: {self.get_full_url(api_url)}")
         try:
-            return await self.client.get(api_url)
+            return await self.client.request(method, api_url, headers=headers)
         except RuntimeError as e:
             if self.client.is_closed:
                 logger.warning("Client already closed")
                 logger.info("Creating a new client")
                 self.__init_client()
-                return await self.client.get(api_url)
+                return await self.client.request(method, api_url, headers=headers)
             else:
                 raise e
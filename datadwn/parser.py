@@ -6,10 +6,12 @@ import numpy as np
 import pandas as pd
 
 from .logger import get_logger
+from .profiler import get_profiler
 from .util import base_off_cwd, json_list, json_obj, t_row, table
 
 
 logger = get_logger()
+profiler = get_profiler()
 
 
 _col_types: Dict[str, type] = {
@@ -52,11 +54,33 @@ class CsvResponseParser:
             raise ValueError("CSV head is not the same as expected")
 
     def get_vehicles(self, path_or_buffer: Union[str, StringIO]) -> table:
-        veh_df = pd.read_csv(filepath_or_buffer=path_or_buffer, sep=";",
-                             dtype=_col_types, usecols=(lambda x: x in _col_types.keys()))
+        with profiler.stage("read_csv"):
+            veh_df = pd.read_csv(filepath_or_buffer=path_or_buffer, sep=";",
+                                 dtype=_col_types, usecols=(lambda x: x in _col_types.keys()))
         self._check_csv_cols(list(veh_df.keys()))
         return veh_df
 
+    def add_file_stems(self, veh_df: table, device: str) -> table:
+        """
+        Adds fileStem column ("<timestamp in whole seconds>#<device>-<vehicleId>"), deterministic and unique,
+        so file names do not depend on the detail json (vectorized, for the whole csv at once).
+        vehicleIds are sequences per device, device (see get_device_id) keeps them apart in one save_dir
+        """
+        with profiler.stage("file_stems"):
+            stamps = veh_df["timestamp"].str.extract(
+                r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})", expand=False)
+            stamps = stamps.str.replace(r"[-:]", "", regex=True).fillna("notime")
+            veh_df["fileStem"] = stamps + f"#{device}-" + veh_df["vehicleId"].astype(str)
+        return veh_df
+
+    def get_file_stem(self, vehicle: t_row) -> Optional[str]:
+        try:
+            return vehicle.fileStem  # type: ignore[attr-defined]
+        except AttributeError:
+            logger.error("fileStem not in the row")
+            logger.debug(f"Row:\n{vehicle}")
+            return None
+
     def get_timestamp(self, vehicle: t_row) -> Optional[str]:
         try:
             return vehicle.timestamp  # type: ignore[attr-defined]
@@ -80,7 +104,8 @@ class JsonResponseParser:
     def get_vehicle(self, contents: str) -> json_obj:
         "raises value error, if no vehicle"
         try:
-            return loads(contents)["data"]
+            with profiler.stage("json_decode"):
+                return loads(contents)["data"]
         except KeyError:
             logger.debug(f"Object: {contents}")
             raise ValueError("Vehicle object not in json")
@@ -117,6 +142,54 @@ class JsonResponseParser:
             logger.debug(f"Object: {vehicle}")
             return None
 
+    def get_gvw(self, vehicle: json_obj) -> Optional[int]:
+        try:
+            return vehicle["gvw"]
+        except KeyError:
+            logger.warning("gvw not in the object")
+            logger.debug(f"Object: {vehicle}")
+            return None
+
+    def get_length(self, vehicle: json_obj) -> Optional[int]:
+        try:
+            return vehicle["length"]
+        except KeyError:
+            logger.warning("length not in the object")
+            logger.debug(f"Object: {vehicle}")
+            return None
+
+    def get_flags(self, vehicle: json_obj) -> Optional[List[str]]:
+        try:
+            return [str(flag) for flag in vehicle["flags"]]
+        except KeyError:
+            logger.warning("flags not in the object")
+            logger.debug(f"Object: {vehicle}")
+            return None
+
+    def get_classes(self, contents: str) -> json_list:
+        "raises value error, if no class list"
+        try:
+            return loads(contents)["data"]
+        except KeyError:
+            logger.debug(f"Object: {contents}")
+            raise ValueError("Class list not in json")
+
+    def get_class_ucid(self, class_obj: json_obj) -> Optional[int]:
+        try:
+            return class_obj["ucid"]
+        except KeyError:
+            logger.warning("ucid not in the class object")
+            logger.debug(f"Object: {class_obj}")
+            return None
+
+    def get_class_name(self, class_obj: json_obj) -> Optional[str]:
+        try:
+            return class_obj["name"]
+        except KeyError:
+            logger.warning("name not in the class object")
+            logger.debug(f"Object: {class_obj}")
+            return None
+
     def get_lane_description(self, vehicle: json_obj) -> Optional[str]:
         try:
             return vehicle["laneDescription"]
@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from statistics import mean
+from typing import List, Optional
+
+from .util import round_to_digits
+
+
+@dataclass(frozen=True)
+class Plan:
+    vehicles: int
+    requests: int
+    json_bytes: int
+    image_bytes: int
+    seconds: float
+    sampled: int
+    data_limit: Optional[int] = None
+
+    @property
+    def total_bytes(self) -> int:
+        return self.json_bytes + self.image_bytes
+
+    def describe(self) -> str:
+        lines = [
+            f"Vehicles: {self.vehicles}",
+            f"Requests: {self.requests}",
+            f"Estimated data: {round_to_digits(self.total_bytes / 1_048_576, 2)} mb " +
+            f"({round_to_digits(self.json_bytes / 1_048_576, 2)} mb json, " +
+            f"{round_to_digits(self.image_bytes / 1_048_576, 2)} mb images)",
+            f"Estimated duration: {round_to_digits(self.seconds, 1)} s",
+            f"(estimated from {self.sampled} sampled vehicles)",
+        ]
+        if self.data_limit is not None and self.total_bytes > self.data_limit:
+            lines.append(
+                f"Data limit ({round_to_digits(self.data_limit / 1_048_576, 2)} mb) " +
+                "will be reached, the rest will be skipped")
+        return "\n".join(lines)
+
+
+class PlanSample:
+    """Collects sizes and latencies of the sampled requests"""
+
+    def __init__(self) -> None:
+        self.vehicles = 0
+        self.image_links = 0
+        self.json_sizes: List[int] = []
+        self.image_sizes: List[int] = []
+        self.latencies: List[float] = []
+
+    def estimate(self, vehicles: int, images_per_vehicle: int, net_worker) -> Plan:
+        """net_worker estimates the duration according to its NetLevel"""
+        if self.vehicles == 0:
+            json_ratio = 1.0
+            links_ratio = images_ratio = float(images_per_vehicle)
+        else:
+            # share of vehicles with a json, image links and downloadable images per vehicle
+            json_ratio = len(self.json_sizes) / self.vehicles
+            links_ratio = self.image_links / self.vehicles
+            images_ratio = len(self.image_sizes) / self.vehicles
+        json_size = mean(self.json_sizes) if self.json_sizes else 0
+        image_size = mean(self.image_sizes) if self.image_sizes else 0
+        latency = mean(self.latencies) if self.latencies else 0.0
+        requests = vehicles + round(vehicles * links_ratio)
+        return Plan(
+            vehicles=vehicles,
+            requests=requests,
+            json_bytes=round(vehicles * json_ratio * json_size),
+            image_bytes=round(vehicles * images_ratio * image_size),
+            seconds=net_worker.estimate_duration(requests, latency),
+            sampled=self.vehicles,
+            data_limit=getattr(net_worker, "data_limit", None),
+        )
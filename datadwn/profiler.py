@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, Optional, Union
+
+from .logger import Logger
+
+
+SAMPLE_INTERVAL = 0.005  # seconds
+
+
+@dataclass
+class StageStats:
+    count: int = 0
+    wall: float = 0.0
+    cpu: Optional[float] = 0.0  # None for stages with awaits (cpu of other tasks would be counted)
+
+    def add(self, wall: float, cpu: Optional[float]) -> None:
+        self.count += 1
+        self.wall += wall
+        if cpu is None or self.cpu is None:
+            self.cpu = None
+        else:
+            self.cpu += cpu
+
+
+class Profiler:
+    """
+    Wall/CPU time per pipeline stage and wait time per lock, optionally with a sampling profiler.
+    Does nothing (except for the with statement) until started.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.stages: Dict[str, StageStats] = {}
+        self.lock_waits: Dict[str, StageStats] = {}
+        self.samples: Counter = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop_sampling = threading.Event()
+        self._start_wall = 0.0
+        self._start_cpu = 0.0
+        self._total_wall = 0.0
+        self._total_cpu = 0.0
+
+    def start(self, sampling: bool = False) -> None:
+        self.enabled = True
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        if sampling:
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(
+                target=self._sample, args=(threading.main_thread().ident,), daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._total_wall = time.perf_counter() - self._start_wall
+        self._total_cpu = time.process_time() - self._start_cpu
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+            self._sampler = None
+
+    @contextmanager
+    def stage(self, name: str, cpu: bool = True) -> Iterator[None]:
+        """cpu=False for stages that await (only wall time is meaningful)"""
+        if not self.enabled:
+            yield
+            return
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(name, StageStats()).add(
+                time.perf_counter() - start_wall,
+                time.thread_time() - start_cpu if cpu else None)
+
+    @asynccontextmanager
+    async def locked(self, name: str, lock) -> AsyncIterator[None]:
+        """`async with lock`, recording how long acquiring took"""
+        if not self.enabled:
+            async with lock:
+                yield
+            return
+        start = time.perf_counter()
+        async with lock:
+            self.lock_waits.setdefault(name, StageStats()).add(
+                time.perf_counter() - start, None)
+            yield
+
+    def instrument_logger(self, logger: Logger) -> None:
+        """Count time spent handling (formatting, writing) log records as the "logging" stage"""
+        handle = logger.handle
+
+        def timed_handle(record):
+            with self.stage("logging"):
+                handle(record)
+
+        logger.handle = timed_handle  # type: ignore[assignment]
+
+    def report(self) -> str:
+        lines = [f"Total: {self._total_wall:.3f} s wall, {self._total_cpu:.3f} s cpu"]
+        for title, stats in (("Stage", self.stages), ("Lock wait", self.lock_waits)):
+            lines.append(f"{title:<16}{'count':>10}{'wall [s]':>12}{'mean [ms]':>12}{'cpu [s]':>12}")
+            for name, stat in sorted(stats.items(), key=lambda item: -item[1].wall):
+                mean = stat.wall / stat.count * 1000 if stat.count else 0.0
+                cpu: Union[str, float] = "-" if stat.cpu is None else f"{stat.cpu:.3f}"
+                lines.append(f"{name:<16}{stat.count:>10}{stat.wall:>12.3f}{mean:>12.3f}{cpu:>12}")
+        return "\n".join(lines)
+
+    def write(self, path: str) -> None:
+        """Write the report to path.txt and sampled stacks (if any) to path.folded"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.txt", "w") as file:
+            file.write(self.report() + "\n")
+        if self.samples:
+            # "folded" stacks, input of flamegraph.pl, speedscope, ...
+            with open(f"{path}.folded", "w") as file:
+                for stack, count in self.samples.most_common():
+                    file.write(f"{stack} {count}\n")
+
+    def _sample(self, thread_id: Optional[int]) -> None:
+        while not self._stop_sampling.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)  # type: ignore[arg-type]
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+
+def get_profiler() -> Profiler:
+    try:
+        return get_profiler.profiler
+    except AttributeError:
+        get_profiler.profiler = Profiler()
+        return get_profiler.profiler
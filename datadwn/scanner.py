@@ -0,0 +1,212 @@
+import csv
+import os
+import sqlite3
+import time
+
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from hashlib import md5
+from typing import Iterator, List, Optional, Set, Tuple
+
+from .logger import get_logger
+
+
+logger = get_logger()
+
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+# saved images relative to save_dir, one per line (resume state, see ImSaver)
+MANIFEST_NAME = "manifest.txt"
+INDEX_NAME = "fsck_index.csv"
+# checked files, sorted by md5 on disk to find duplicates (removed after the scan)
+CHECKS_DB_NAME = ".fsck_checks.sqlite"
+MAX_LISTED = 20  # invalid paths kept in ScanSummary (all are in the index)
+PROGRESS_EVERY = 10.0  # seconds
+# (relative path, size, md5, valid)
+file_check = Tuple[str, int, str, bool]
+
+
+def check_files(save_dir: str, paths: List[str]) -> List[file_check]:
+    """Hash and validate files (paths relative to save_dir), runs in worker processes"""
+    checks: List[file_check] = []
+    for path in paths:
+        try:
+            with open(os.path.join(save_dir, path), "rb") as file:
+                data = file.read()
+        except OSError:
+            checks.append((path, -1, "", False))
+            continue
+        # truncated downloads are missing the end of image marker
+        valid = data[:2] == JPEG_SOI and data.rstrip(b"\x00")[-2:] == JPEG_EOI
+        checks.append((path, len(data), md5(data).hexdigest(), valid))
+    return checks
+
+
+@dataclass
+class ScanSummary:
+    files: int = 0
+    bytes: int = 0
+    invalid: int = 0
+    # the first MAX_LISTED invalid paths
+    invalid_listed: List[str] = field(default_factory=list)
+    duplicates: int = 0
+    # directories that could not be listed (skipped)
+    unreadable_dirs: int = 0
+    # valid images per directory (lane/type/ucid)
+    per_dir: Counter = field(default_factory=Counter)
+
+
+class ImageScanner:
+    """
+    Integrity scan of an existing save_dir (the lane/type/ucid tree of LocTypeDirector).
+
+    Directories are listed in threads (never more than a few listings ahead),
+    files are hashed and checked for JPEG markers in a process pool,
+    in chunks (never more than a few chunks in flight).
+    Checks go to a sqlite file and duplicates are found by md5 order on disk,
+    so memory does not grow with the number of files.
+    Writes the index (path;size;md5;valid;duplicate_of, ordered by md5) and the manifest
+    of valid images (resume state), both relative to save_dir.
+    """
+
+    def __init__(self, save_dir: str, file_extension: str, processes: int,
+                 threads: int, chunk_size: int) -> None:
+        self.save_dir = save_dir
+        self.suffix = f".{file_extension}"
+        self.processes = processes
+        self.threads = threads
+        self.chunk_size = chunk_size
+        # files that are not images of the tree
+        self.skip_dirs: Set[str] = {"catalog"}
+        self.unreadable_dirs = 0
+
+    def walk(self) -> Iterator[str]:
+        """
+        Yield image paths relative to save_dir, directories are listed in parallel.
+        Only a few listings run ahead of the consumer, the rest waits as directory names.
+        """
+        max_pending = self.threads * 2
+        # depth first, so the waiting directories stay few
+        waiting: List[str] = [""]
+        pending: Set[Future] = set()
+        with ThreadPoolExecutor(self.threads) as pool:
+            while waiting or pending:
+                while waiting and len(pending) < max_pending:
+                    pending.add(pool.submit(self._list_dir, waiting.pop()))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    listing = future.result()
+                    if listing is None:
+                        self.unreadable_dirs += 1
+                        continue
+                    dirs, files = listing
+                    waiting.extend(dirs)
+                    yield from files
+
+    def scan(self) -> ScanSummary:
+        summary = ScanSummary()
+        manifest_path = os.path.join(self.save_dir, MANIFEST_NAME)
+        db_path = os.path.join(self.save_dir, CHECKS_DB_NAME)
+        if os.path.exists(db_path):
+            # left over by an interrupted scan
+            os.remove(db_path)
+        db = sqlite3.connect(db_path)
+        try:
+            db.execute("CREATE TABLE checks (path TEXT, size INTEGER, md5 TEXT, valid INTEGER)")
+            start = last_progress = time.perf_counter()
+            with open(manifest_path + ".tmp", "w") as manifest_file, \
+                    ProcessPoolExecutor(self.processes) as pool:
+                pending: Set[Future] = set()
+                for chunk in self._chunks(self.walk()):
+                    pending.add(pool.submit(check_files, self.save_dir, chunk))
+                    if len(pending) >= self.processes * 4:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._record(future.result(), summary, db, manifest_file)
+                    if time.perf_counter() - last_progress > PROGRESS_EVERY:
+                        last_progress = time.perf_counter()
+                        self._log_progress(summary, last_progress - start)
+                for future in pending:
+                    self._record(future.result(), summary, db, manifest_file)
+            db.commit()
+            self._write_index(db, summary)
+        finally:
+            db.close()
+            os.remove(db_path)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        summary.unreadable_dirs = self.unreadable_dirs
+        self._log_progress(summary, time.perf_counter() - start)
+        return summary
+
+    def _list_dir(self, rel_dir: str) -> Optional[Tuple[List[str], List[str]]]:
+        """(subdirectories, image files), None if the directory can not be listed"""
+        dirs: List[str] = []
+        files: List[str] = []
+        try:
+            with os.scandir(os.path.join(self.save_dir, rel_dir)) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if rel_dir or entry.name not in self.skip_dirs:
+                            dirs.append(rel_path)
+                    elif entry.name.endswith(self.suffix):
+                        files.append(rel_path)
+        except OSError as e:
+            logger.error(f"Skipping directory {rel_dir or '.'}, could not list it: {repr(e)}")
+            return None
+        return dirs, files
+
+    def _chunks(self, paths: Iterator[str]) -> Iterator[List[str]]:
+        chunk: List[str] = []
+        for path in paths:
+            chunk.append(path)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _record(self, checks: List[file_check], summary: ScanSummary,
+                db: sqlite3.Connection, manifest_file) -> None:
+        for path, size, _, valid in checks:
+            summary.files += 1
+            summary.bytes += max(size, 0)
+            if not valid:
+                summary.invalid += 1
+                if len(summary.invalid_listed) < MAX_LISTED:
+                    summary.invalid_listed.append(path)
+            else:
+                manifest_file.write(path + "\n")
+                summary.per_dir[os.path.dirname(path)] += 1
+        db.executemany("INSERT INTO checks VALUES (?, ?, ?, ?)",
+                       ((path, size, hash_, int(valid)) for path, size, hash_, valid in checks))
+
+    def _write_index(self, db: sqlite3.Connection, summary: ScanSummary) -> None:
+        """Write the index in md5 order, valid images after the first one with the same md5 are duplicates"""
+        index_path = os.path.join(self.save_dir, INDEX_NAME)
+        # the sort happens on disk (sqlite), not in memory
+        db.execute("CREATE INDEX checks_md5 ON checks (md5, valid DESC)")
+        with open(index_path + ".tmp", "w", newline="") as index_file:
+            index = csv.writer(index_file, delimiter=";")
+            index.writerow(("path", "size", "md5", "valid", "duplicate_of"))
+            last_hash: Optional[str] = None
+            first = ""
+            for path, size, hash_, valid in db.execute(
+                    "SELECT path, size, md5, valid FROM checks ORDER BY md5, valid DESC, rowid"):
+                duplicate_of = ""
+                if valid:
+                    if hash_ != last_hash:
+                        last_hash, first = hash_, path
+                    else:
+                        duplicate_of = first
+                        summary.duplicates += 1
+                index.writerow((path, size, hash_, valid, duplicate_of))
+        os.replace(index_path + ".tmp", index_path)
+
+    def _log_progress(self, summary: ScanSummary, elapsed: float) -> None:
+        rate = summary.files / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Scanned {summary.files} files ({summary.bytes / 1_048_576:.1f} mb) " +
+                    f"in {elapsed:.1f}s ({rate:.0f} files/s), " +
+                    f"invalid: {summary.invalid}, duplicates: {summary.duplicates}")
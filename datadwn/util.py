@@ -1,5 +1,6 @@
 import os as _os
 
+from hashlib import md5 as _md5
 from pathlib import Path as _Path
 from typing import Any as _Any
 from typing import Dict as _Dict
@@ -27,6 +28,13 @@ def round_to_digits(num: float, digits: int) -> _Union[int, float]:
     return round(num, digits) if digits > 0 else round(num)
 
 
+def get_device_id(base_url: str) -> str:
+    """
+    Short id of the device behind base_url (vehicleIds and class lists are per device).
+    """
+    return _md5(base_url.rstrip("/").lower().encode()).hexdigest()[:8]
+
+
 def get_relpath(_from: str, to: str) -> str:
     """
     Get a relative path from somewhere to somewhere (inputs can be relative or absolute paths).
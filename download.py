@@ -3,6 +3,7 @@ import asyncio
 import os
 import sys
 
+from datetime import datetime
 from pathlib import Path
 from typing import List
 
@@ -10,14 +11,28 @@ from datadwn import defaults
 from datadwn.logger import get_logger
 from datadwn.logic import Downloader, DownloaderArgs
 from datadwn.net_worker import NetLevels
+from datadwn.profiler import get_profiler
 from datadwn.util import base_off_cwd
 
 
 logger = get_logger()
 
 
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
+def non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a non-negative integer")
+    return number
+
+
 def parse_arguments():
-    # ENHANCE: required flag "--verified_classes" | "-v", implying, that the caller has checked remote class/list
     LAST_ARGS_SAVE_PATH = base_off_cwd(
         f"last_{Path(__file__).stem}_args.txt", __file__)
 
@@ -56,9 +71,50 @@ def parse_arguments():
                         help="Network levels to use when reduced network usage is desired, levels: " +
                         f"{', '.join(net_level_texts)}")
     parser.add_argument("--data_limit", "--download_limit", type=float, default=defaults.DATA_LIMIT,
-                        metavar="LIMIT", help="Used only for net level 2; limit (in mb) of downloaded data")
+                        metavar="LIMIT", help="Used only for net level 1; limit (in mb) of downloaded data")
     parser.add_argument("-l", "--link_has_number", default=defaults.LINK_VERSION, required=True,
                         type=bool, help="Whether the links to vehicle/detail have api version number in them; this field is required")
+    parser.add_argument("-p", "--plan", default=defaults.PLAN, action="store_true",
+                        help="Estimate requests, data and duration first and ask only once for the whole run " +
+                        "(no confirmations per download afterwards)")
+    parser.add_argument("--dry_run", default=defaults.DRY_RUN, action="store_true",
+                        help="Only show the plan (see --plan), do not download")
+    parser.add_argument("--plan_sample", type=non_negative_int, default=defaults.PLAN_SAMPLE, metavar="N",
+                        help="Number of vehicles downloaded to estimate the plan")
+    parser.add_argument("--class_cache", default=defaults.CLASS_CACHE, metavar="PATH",
+                        help="Directory to cache class/list of devices in")
+    parser.add_argument("--tags", nargs="+", default=defaults.TAGS, metavar="TAG",
+                        help="Download all of these image tags (views) of every vehicle, e.g. SNAP SNAPB; " +
+                        f"if left None, only the first available of {defaults.TAG_PREFERENCE}")
+    parser.add_argument("--catalog", default=defaults.CATALOG, action="store_true",
+                        help="Write a parquet catalog of saved images (metadata, path, size, md5) " +
+                        "into save_dir/catalog")
+    parser.add_argument("--catalog_batch", type=int, default=defaults.CATALOG_BATCH, metavar="ROWS",
+                        help="Rows per catalog part file (written as soon as full)")
+    parser.add_argument("--profile", default=defaults.PROFILE, action="store_true",
+                        help="Record wall/cpu time per pipeline stage and lock wait times, " +
+                        "the report is logged and written to PROFILE_OUTPUT.txt")
+    parser.add_argument("--profile_sampling", default=defaults.PROFILE_SAMPLING, action="store_true",
+                        help="Also run a sampling profiler, stacks are written to PROFILE_OUTPUT.folded " +
+                        "(flamegraph.pl/speedscope format); implies --profile")
+    parser.add_argument("--profile_output", default=defaults.PROFILE_OUTPUT, metavar="PATH",
+                        help="Path (without extension) of the profile report")
+    parser.add_argument("--uvloop", default=defaults.UVLOOP, action="store_true",
+                        help="Use the uvloop event loop (has to be installed)")
+    parser.add_argument("--time_from", type=datetime.fromisoformat, default=defaults.TIME_FROM, metavar="TIME",
+                        help="List vehicles from this time (ISO format, e.g. 2022-05-04T10:00) from the API " +
+                        "instead of reading input_file")
+    parser.add_argument("--time_to", type=datetime.fromisoformat, default=defaults.TIME_TO, metavar="TIME",
+                        help="End of the listed time window (exclusive); now if left None")
+    parser.add_argument("--windows", type=positive_int, default=defaults.WINDOWS, metavar="N",
+                        help="Number of sub-windows of the time window listed in parallel")
+    parser.add_argument("--page_size", type=positive_int, default=defaults.PAGE_SIZE, metavar="N",
+                        help="Vehicles per page of the vehicle list")
+    parser.add_argument("--username", default=defaults.USERNAME,
+                        help="Log in to the API with this username (the token is used for all requests)")
+    parser.add_argument("--password", default=None,
+                        help=f"Password for --username; read from the {defaults.PASSWORD_ENV} " +
+                        "environment variable if left None (not saved with --save_args)")
     # * add arguments here
 
     if len(sys.argv) == 1 and os.path.exists(LAST_ARGS_SAVE_PATH):
@@ -68,19 +124,64 @@ def parse_arguments():
         args = parser.parse_args()
         if args.save_args:
             with open(LAST_ARGS_SAVE_PATH, "w") as file:
-                file.write(" ".join(sys.argv[1:]))
+                file.write(" ".join(_without_password(sys.argv[1:])))
+    if args.time_from is None and args.time_to is not None:
+        parser.error("--time_to needs --time_from (vehicles are read from input_file without it)")
+    if args.time_from is not None and args.time_to is not None and \
+            (args.time_from.tzinfo is None) != (args.time_to.tzinfo is None):
+        parser.error("--time_from and --time_to must both have a UTC offset (e.g. +02:00) or both not")
+    if args.time_from is not None and \
+            (args.time_to or datetime.now(args.time_from.tzinfo)) <= args.time_from:
+        parser.error("--time_to (now if left None) must be after --time_from")
+    if args.password is None:
+        args.password = os.environ.get(defaults.PASSWORD_ENV)
     # from megabytes to bytes
     args.data_limit *= 1_048_576
     return args
 
 
-async def main():
-    args: DownloaderArgs = parse_arguments()
-    logger.info(args)
+def _without_password(argv: List[str]) -> List[str]:
+    stripped: List[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "--password":
+            skip = True
+        elif not arg.startswith("--password="):
+            stripped.append(arg)
+    return stripped
 
-    downloader = Downloader(args)
-    await downloader.get_images()
+
+def use_uvloop() -> None:
+    try:
+        import uvloop
+    except ImportError:
+        logger.error("uvloop is not installed (pip install uvloop), using the default event loop")
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Using uvloop event loop")
+
+
+async def main(args: DownloaderArgs):
+    logger.info(argparse.Namespace(**{**vars(args), "password": "***" if args.password else None}))
+    profiler = get_profiler()
+    if args.profile or args.profile_sampling:
+        profiler.instrument_logger(logger)
+        profiler.start(sampling=args.profile_sampling)
+    try:
+        downloader = Downloader(args)
+        await downloader.get_images()
+    finally:
+        if profiler.enabled:
+            profiler.stop()
+            logger.info(f"Profile:\n{profiler.report()}")
+            profiler.write(args.profile_output)
+            logger.info(f"Profile written to {args.profile_output}.*")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args: DownloaderArgs = parse_arguments()
+    if args.uvloop:
+        use_uvloop()
+    asyncio.run(main(args))
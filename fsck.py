@@ -0,0 +1,54 @@
+import argparse
+import os
+
+from datadwn import defaults
+from datadwn.logger import get_logger
+from datadwn.scanner import INDEX_NAME, MANIFEST_NAME, ImageScanner
+
+
+logger = get_logger()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Check integrity of downloaded images and rebuild the manifest (resume state) " +
+        f"and the dedup index ({MANIFEST_NAME}, {INDEX_NAME} in save_dir)"
+    )
+    parser.add_argument("-o", "--save_dir", default=defaults.SAVE_DIR,
+                        metavar="PATH", help="Directory with downloaded images")
+    parser.add_argument("--file_extension", default=defaults.FILE_EXTENSION,
+                        metavar="EXT", help="File extension of images")
+    parser.add_argument("-j", "--processes", type=int, default=os.cpu_count() or 1,
+                        metavar="N", help="Processes hashing and validating files")
+    parser.add_argument("--threads", type=int, default=defaults.FSCK_THREADS,
+                        metavar="N", help="Threads listing directories")
+    parser.add_argument("--chunk_size", type=int, default=defaults.FSCK_CHUNK_SIZE,
+                        metavar="FILES", help="Files per task of a process")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    logger.info(args)
+    scanner = ImageScanner(args.save_dir, args.file_extension,
+                           args.processes, args.threads, args.chunk_size)
+    summary = scanner.scan()
+    logger.success("Finished!")
+    for dir_, count in sorted(summary.per_dir.items()):
+        logger.info(f"{dir_}: {count} images")
+    if summary.invalid:
+        logger.warning(f"{summary.invalid} invalid (truncated) images, " +
+                       f"they are left out of {MANIFEST_NAME} (downloaded again on next run):")
+        for path in summary.invalid_listed:
+            logger.warning(f"  {path}")
+        if summary.invalid > len(summary.invalid_listed):
+            logger.warning(f"  ... see {INDEX_NAME}")
+    if summary.unreadable_dirs:
+        logger.error(f"{summary.unreadable_dirs} directories could not be listed, " +
+                     "their images are not in the index and the manifest")
+    logger.info(f"Duplicates: {summary.duplicates} (see duplicate_of in {INDEX_NAME})")
+
+
+if __name__ == "__main__":
+    main()